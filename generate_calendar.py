@@ -1,86 +1,299 @@
-import requests
+import asyncio
+import aiohttp
+import hashlib
+import os
+import pickle
 from datetime import datetime, timedelta
+from email.utils import parsedate_to_datetime
+from operator import itemgetter
 import pytz
 from icalendar import Calendar, Event
-import json
+import orjson
 
-def scrape_mlb_api():
+HTTP_CACHE_FILE = '.http_cache.pkl'
+GAMES_CACHE_FILE = 'games_cache.pkl'
+CALENDAR_FILE = 'mlb_playoffs.ics'
+SIGNATURE_FILE = '.mlb_playoffs.sig'
+
+ET_TZ = pytz.timezone('America/New_York')
+UTC = pytz.UTC
+
+# Static calendar header properties
+CALENDAR_PROPERTIES = (
+    ('prodid', '-//MLB Playoff Calendar//EN'),
+    ('version', '2.0'),
+    ('x-wr-calname', 'MLB Playoffs 2025'),
+    ('x-wr-timezone', 'America/New_York'),
+    ('x-wr-caldesc', 'MLB Playoff Schedule - Auto-updated daily from MLB.com'),
+)
+
+# Assume 3.5 hours for baseball games
+GAME_DURATION = timedelta(hours=3, minutes=30)
+
+# Bump when create_ical_calendar changes how events are written, so the
+# existing calendar file is regenerated even if no game changed
+CALENDAR_FORMAT_VERSION = 1
+
+# Game states that will not change again once reached
+FINISHED_STATUSES = {'Final', 'Game Over', 'Completed Early', 'Cancelled'}
+
+# Retry transient API failures with exponential backoff
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+MAX_RETRIES = 3
+RETRY_BACKOFF = 0.5
+
+def load_http_cache():
+    """Load cached raw schedule responses keyed by URL"""
+    try:
+        with open(HTTP_CACHE_FILE, 'rb') as f:
+            return pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError):
+        return {}
+
+def save_http_cache(cache):
+    """Persist cached raw schedule responses for the next run"""
+    with open(HTTP_CACHE_FILE, 'wb') as f:
+        pickle.dump(cache, f, protocol=5)
+
+def load_games_cache(season):
+    """Load previously parsed games for this season keyed by game ID, and the last refresh date"""
+    try:
+        with open(GAMES_CACHE_FILE, 'rb') as f:
+            cache = pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError):
+        return {}, None
+    
+    # Start over when the season rolls over
+    if cache.get('season') != season:
+        return {}, None
+    return cache.get('games', {}), cache.get('refreshed')
+
+def save_games_cache(season, games_by_id, refreshed):
+    """Persist parsed games so later runs only refresh upcoming dates"""
+    with open(GAMES_CACHE_FILE, 'wb') as f:
+        pickle.dump({'season': season, 'games': games_by_id, 'refreshed': refreshed}, f, protocol=5)
+
+def retry_delay(response, attempt):
+    """Honor Retry-After when the server sends one, else back off exponentially"""
+    retry_after = response.headers.get('Retry-After') if response is not None else None
+    if retry_after:
+        # Retry-After is either a number of seconds or an HTTP date
+        try:
+            return max(0.0, float(retry_after))
+        except ValueError:
+            pass
+        try:
+            retry_at = parsedate_to_datetime(retry_after)
+        except (TypeError, ValueError):
+            pass
+        else:
+            if retry_at.tzinfo is None:
+                retry_at = UTC.localize(retry_at)
+            return max(0.0, (retry_at - datetime.now(UTC)).total_seconds())
+    
+    return RETRY_BACKOFF * 2 ** attempt
+
+async def get_with_retries(session, url, headers):
+    """GET a URL, retrying rate limits, server errors, timeouts and dropped connections"""
+    for attempt in range(MAX_RETRIES + 1):
+        response = None
+        try:
+            async with session.get(url, headers=headers) as response:
+                if response.status not in RETRY_STATUSES or attempt == MAX_RETRIES:
+                    response.raise_for_status()
+                    return response.status, response.headers, await response.read()
+                print(f"  HTTP {response.status}, retrying...")
+        except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+            if attempt == MAX_RETRIES:
+                raise
+            print(f"  Connection error ({e!r}), retrying...")
+            response = None
+        
+        await asyncio.sleep(retry_delay(response, attempt))
+
+async def fetch_schedule(session, url, cache):
+    """Fetch a single schedule payload from MLB's official API"""
+    print(f"Fetching from MLB API: {url}")
+    
+    # Revalidate against the previous response if we have one
+    cached = cache.get(url)
+    request_headers = {}
+    if cached:
+        if cached.get('etag'):
+            request_headers['If-None-Match'] = cached['etag']
+        if cached.get('last_modified'):
+            request_headers['If-Modified-Since'] = cached['last_modified']
+    
+    status, response_headers, body = await get_with_retries(session, url, request_headers)
+    if status == 304 and cached:
+        print("  Not modified, using cached response")
+        # Bodies are kept as raw bytes so they are only decoded on a hit
+        return orjson.loads(cached['body'])
+    
+    data = orjson.loads(body)
+    
+    etag = response_headers.get('ETag')
+    last_modified = response_headers.get('Last-Modified')
+    
+    if etag or last_modified:
+        cache[url] = {
+            'etag': etag,
+            'last_modified': last_modified,
+            'body': body
+        }
+    
+    return data
+
+def parse_games(data, seen_ids):
+    """Yield parsed games from a schedule payload, skipping ones already seen"""
+    for date_entry in data.get('dates', []):
+        for game in date_entry.get('games', []):
+            # Get game time
+            game_time_str = game.get('gameDate')
+            if not game_time_str:
+                continue
+            
+            # Parse ISO format time (fromisoformat only accepts 'Z' from 3.11)
+            try:
+                game_time = datetime.fromisoformat(game_time_str.replace('Z', '+00:00'))
+            except ValueError as e:
+                print(f"Error parsing game time {game_time_str!r}: {e}")
+                continue
+            
+            # Convert to ET
+            game_time_et = game_time.astimezone(ET_TZ)
+            
+            # Get team info
+            teams = game.get('teams') or {}
+            away = (teams.get('away') or {}).get('team') or {}
+            home = (teams.get('home') or {}).get('team') or {}
+            away_team = away.get('name', 'TBD')
+            home_team = home.get('name', 'TBD')
+            
+            # Get venue
+            venue = (game.get('venue') or {}).get('name', 'TBD')
+            
+            # Get status
+            status = (game.get('status') or {}).get('detailedState', '')
+            
+            # Get series description
+            series_desc = game.get('seriesDescription', 'MLB Playoffs')
+            game_number = game.get('seriesGameNumber', '')
+            
+            # Get game ID to avoid duplicates
+            game_id = game.get('gamePk', '')
+            
+            # Check if already added
+            if game_id in seen_ids:
+                continue
+            seen_ids.add(game_id)
+            
+            yield {
+                'game_id': game_id,
+                'away_team': away_team,
+                'home_team': home_team,
+                'datetime': game_time_et,
+                'venue': venue,
+                'series': series_desc,
+                'game_number': game_number,
+                'status': status
+            }
+
+async def scrape_mlb_api():
     """Scrape MLB playoff schedule from MLB's official API"""
     
     try:
         current_year = datetime.now().year
-        games = []
         
-        # Try multiple game types for playoffs
-        # F = Postseason (all rounds)
+        # Playoff game types
+        # F = Wild Card
         # D = Division Series
         # L = League Championship
         # W = World Series
         game_types = ['F', 'D', 'L', 'W']
+        seen_ids = set()
         
-        for game_type in game_types:
-            url = f"https://statsapi.mlb.com/api/v1/schedule?sportId=1&season={current_year}&gameType={game_type}&hydrate=team,venue"
-            
-            print(f"Fetching from MLB API (type {game_type}): {url}")
-            
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-            }
-            response = requests.get(url, headers=headers)
-            response.raise_for_status()
-            
-            data = response.json()
+        # Finished games never change, so once they are cached only ask for
+        # the dates since the last refresh or the earliest unfinished game,
+        # whichever comes first, through the next two weeks. Missed daily
+        # runs then widen the window instead of leaving games stale.
+        games_by_id, last_refreshed = load_games_cache(current_year)
+        today = datetime.now(ET_TZ).date()
+        date_range = ''
+        if games_by_id:
+            start_date = today - timedelta(days=1)
+            if last_refreshed:
+                start_date = min(start_date, last_refreshed)
+            unfinished_dates = [
+                game['datetime'].date() for game in games_by_id.values()
+                if game.get('status') not in FINISHED_STATUSES
+            ]
+            if unfinished_dates:
+                start_date = min(start_date, min(unfinished_dates))
+            end_date = today + timedelta(days=14)
+            date_range = f"&startDate={start_date.isoformat()}&endDate={end_date.isoformat()}"
+            print(f"Loaded {len(games_by_id)} cached games, refreshing {start_date} to {end_date}")
+        
+        schedule_url = f"https://statsapi.mlb.com/api/v1/schedule?sportId=1&season={current_year}&gameType={{game_type}}&hydrate=team,venue{date_range}"
+        
+        headers = {
+            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
+        }
+        
+        http_cache = load_http_cache()
+        
+        # One pooled session so every request reuses the same connections
+        connector = aiohttp.TCPConnector(limit=len(game_types))
+        async with aiohttp.ClientSession(headers=headers, connector=connector) as session:
+            # Ask for every round in a single request first
+            combined_url = schedule_url.format(game_type=','.join(game_types))
+            requested_urls = [combined_url]
+            try:
+                responses = [await fetch_schedule(session, combined_url, http_cache)]
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                # Fall back to one request per round, fired concurrently.
+                # An empty combined result means the rounds are empty too,
+                # so only a failed request is worth retrying this way.
+                print(f"Error fetching combined postseason schedule: {e!r}")
+                round_urls = [schedule_url.format(game_type=game_type) for game_type in game_types]
+                requested_urls.extend(round_urls)
+                responses = await asyncio.gather(*(
+                    fetch_schedule(session, url, http_cache) for url in round_urls
+                ))
+        
+        # The date range moves daily, so drop entries for URLs no longer requested
+        save_http_cache({url: http_cache[url] for url in requested_urls if url in http_cache})
+        
+        fresh_games = [game for data in responses for game in parse_games(data, seen_ids)]
+        
+        refresh_ok = True
+        if date_range:
+            window_ids = [
+                game_id for game_id, game in games_by_id.items()
+                if start_date <= game['datetime'].date() <= end_date
+            ]
             
-            # Parse the schedule data
-            if 'dates' in data:
-                for date_entry in data['dates']:
-                    for game in date_entry.get('games', []):
-                        try:
-                            # Get game time
-                            game_time_str = game.get('gameDate')
-                            if not game_time_str:
-                                continue
-                            
-                            # Parse ISO format time
-                            game_time = datetime.strptime(game_time_str, '%Y-%m-%dT%H:%M:%SZ')
-                            game_time = pytz.UTC.localize(game_time)
-                            
-                            # Convert to ET
-                            et_tz = pytz.timezone('America/New_York')
-                            game_time_et = game_time.astimezone(et_tz)
-                            
-                            # Get team info
-                            away_team = game.get('teams', {}).get('away', {}).get('team', {}).get('name', 'TBD')
-                            home_team = game.get('teams', {}).get('home', {}).get('team', {}).get('name', 'TBD')
-                            
-                            # Get venue
-                            venue = game.get('venue', {}).get('name', 'TBD')
-                            
-                            # Get series description
-                            series_desc = game.get('seriesDescription', 'MLB Playoffs')
-                            game_number = game.get('seriesGameNumber', '')
-                            
-                            # Get game ID to avoid duplicates
-                            game_id = game.get('gamePk', '')
-                            
-                            # Check if already added
-                            if not any(g.get('game_id') == game_id for g in games):
-                                games.append({
-                                    'game_id': game_id,
-                                    'away_team': away_team,
-                                    'home_team': home_team,
-                                    'datetime': game_time_et,
-                                    'venue': venue,
-                                    'series': series_desc,
-                                    'game_number': game_number,
-                                    'status': game.get('status', {}).get('detailedState', '')
-                                })
-                        except Exception as e:
-                            print(f"Error parsing game: {e}")
-                            continue
+            if window_ids and not any(data.get('dates') for data in responses):
+                # An empty response for a window we know has games is more
+                # likely an API hiccup than a cleared schedule
+                print("Refreshed window came back empty, keeping cached games as they are")
+                refresh_ok = False
+            else:
+                # Forget upcoming cached games the API no longer lists. Earlier
+                # games are never dropped based on a windowed response, since
+                # the full season is not refetched to bring them back.
+                for game_id in window_ids:
+                    if game_id not in seen_ids and games_by_id[game_id]['datetime'].date() >= today:
+                        del games_by_id[game_id]
+        
+        if refresh_ok:
+            games_by_id.update((game['game_id'], game) for game in fresh_games)
+            save_games_cache(current_year, games_by_id, today)
+        
+        games = list(games_by_id.values())
         
         # Sort by datetime
-        games.sort(key=lambda x: x['datetime'])
+        games.sort(key=itemgetter('datetime'))
         
         return games
     
@@ -93,11 +306,11 @@ def scrape_mlb_api():
 def create_ical_calendar(games):
     """Create iCalendar file from games"""
     cal = Calendar()
-    cal.add('prodid', '-//MLB Playoff Calendar//EN')
-    cal.add('version', '2.0')
-    cal.add('x-wr-calname', 'MLB Playoffs 2025')
-    cal.add('x-wr-timezone', 'America/New_York')
-    cal.add('x-wr-caldesc', 'MLB Playoff Schedule - Auto-updated daily from MLB.com')
+    for name, value in CALENDAR_PROPERTIES:
+        cal.add(name, value)
+    
+    # Every event in one run shares the same timestamp
+    now_utc = datetime.now(UTC)
     
     for game in games:
         if not game.get('datetime'):
@@ -121,8 +334,8 @@ def create_ical_calendar(games):
         # Add start time
         event.add('dtstart', game['datetime'])
         
-        # Add end time (assume 3.5 hours for baseball games)
-        event.add('dtend', game['datetime'] + timedelta(hours=3, minutes=30))
+        # Add end time
+        event.add('dtend', game['datetime'] + GAME_DURATION)
         
         # Add description
         status = game.get('status', '')
@@ -141,27 +354,62 @@ def create_ical_calendar(games):
         event.add('uid', uid)
         
         # Add timestamp
-        event.add('dtstamp', datetime.now(pytz.UTC))
+        event.add('dtstamp', now_utc)
         
         cal.add_component(event)
     
     return cal
 
+def games_signature(games):
+    """Hash every game field and calendar setting that ends up in the calendar"""
+    fields = [
+        (
+            game.get('game_id'),
+            game['datetime'].isoformat() if game.get('datetime') else None,
+            game.get('away_team'),
+            game.get('home_team'),
+            game.get('venue'),
+            game.get('series'),
+            game.get('game_number'),
+            game.get('status', '')
+        )
+        for game in games
+    ]
+    settings = (CALENDAR_FORMAT_VERSION, CALENDAR_PROPERTIES, GAME_DURATION.total_seconds())
+    return hashlib.sha256(repr((settings, fields)).encode()).hexdigest()
+
+def read_signature():
+    """Read the signature of the games behind the existing calendar file"""
+    try:
+        with open(SIGNATURE_FILE, 'r') as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
 def main():
     print("Fetching MLB playoff schedule from MLB.com API...")
-    games = scrape_mlb_api()
+    games = asyncio.run(scrape_mlb_api())
     
     print(f"Found {len(games)} games")
     
     if games:
-        print("\nCreating calendar file...")
-        cal = create_ical_calendar(games)
+        signature = games_signature(games)
         
-        # Write to file
-        with open('mlb_playoffs.ics', 'wb') as f:
-            f.write(cal.to_ical())
+        # Skip regeneration when nothing changed since the last run
+        if os.path.exists(CALENDAR_FILE) and read_signature() == signature:
+            print(f"\nSchedule unchanged, keeping existing calendar file: {CALENDAR_FILE}")
+        else:
+            print("\nCreating calendar file...")
+            cal = create_ical_calendar(games)
+            
+            # Write to file
+            with open(CALENDAR_FILE, 'wb') as f:
+                f.write(cal.to_ical())
+            with open(SIGNATURE_FILE, 'w') as f:
+                f.write(signature)
+            
+            print(f"Calendar file created: {CALENDAR_FILE}")
         
-        print("Calendar file created: mlb_playoffs.ics")
         print("\nGames found:")
         for game in games[:15]:  # Show first 15
             if game.get('datetime'):